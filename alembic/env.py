@@ -2,8 +2,6 @@ from logging.config import fileConfig
 from sqlalchemy import engine_from_config, pool
 from alembic import context
 import os
-import importlib
-import pkgutil
 
 # --- Load Configurations ---
 config = context.config
@@ -12,16 +10,12 @@ config = context.config
 if config.config_file_name is not None:
     fileConfig(config.config_file_name)
 
-# --- Dynamically Load Models ---
-def import_models_from_package(package_name):
-    """Import all models from a given package."""
-    package = importlib.import_module(package_name)
-    for _, module_name, is_pkg in pkgutil.walk_packages(package.__path__, package.__name__ + "."):
-        if not is_pkg:
-            importlib.import_module(module_name)
+# --- Load Models ---
+# Import every model explicitly so Base.metadata is populated without walking
+# the app.models package on each Alembic run. Add new model modules here.
+from app.models.user_model import User, UserRoleCount, RetentionAnalytics  # noqa: F401
 
-# Load all models in the app.models directory
-import_models_from_package("app.models")
+MODELS = (User, UserRoleCount, RetentionAnalytics)
 
 # Import Base metadata after loading models
 from app.database import Base
@@ -44,19 +38,27 @@ def run_migrations_offline() -> None:
 # --- Online Migrations ---
 def run_migrations_online() -> None:
     """Run migrations in 'online' mode."""
+    # A single pooled connection is reused for the whole (single-threaded) run
+    # instead of reconnecting on every checkout.
     connectable = engine_from_config(
         config.get_section(config.config_ini_section, {}),
         prefix="sqlalchemy.",
-        poolclass=pool.NullPool,
+        poolclass=pool.QueuePool,
+        pool_size=1,
+        max_overflow=0,
+        pool_pre_ping=True,
     )
 
-    with connectable.connect() as connection:
-        context.configure(
-            connection=connection, target_metadata=target_metadata
-        )
+    try:
+        with connectable.connect() as connection:
+            context.configure(
+                connection=connection, target_metadata=target_metadata
+            )
 
-        with context.begin_transaction():
-            context.run_migrations()
+            with context.begin_transaction():
+                context.run_migrations()
+    finally:
+        connectable.dispose()
 
 # --- Determine Migration Mode ---
 if context.is_offline_mode():
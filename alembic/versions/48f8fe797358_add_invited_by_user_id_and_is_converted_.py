@@ -31,19 +31,22 @@ def upgrade() -> None:
     )
 
     # ### Add new columns to users table ###
+    # Apply every change to users in one ALTER TABLE so the exclusive lock is
+    # taken once, and give up quickly instead of queueing behind long transactions.
+    op.execute("SET LOCAL lock_timeout = '5s'")
+    alterations = []
+
     # Only add 'is_converted' if it doesn't already exist
     if not column_exists("users", "is_converted"):
-        op.add_column('users', sa.Column(
-            'is_converted', sa.Boolean(), server_default=sa.sql.expression.false(), nullable=False
-        ))
+        alterations.append("ADD COLUMN is_converted BOOLEAN DEFAULT false NOT NULL")
 
-    # Add invited_by_user_id
-    op.add_column('users', sa.Column(
-        'invited_by_user_id', sa.UUID(), nullable=True
-    ))
+    # Add invited_by_user_id and its foreign key
+    alterations.append("ADD COLUMN invited_by_user_id UUID")
+    alterations.append(
+        "ADD CONSTRAINT fk_users_invited_by FOREIGN KEY (invited_by_user_id) REFERENCES users (id)"
+    )
 
-    # Add foreign key for invited_by_user_id
-    op.create_foreign_key('fk_users_invited_by', 'users', 'users', ['invited_by_user_id'], ['id'])
+    op.execute(f"ALTER TABLE users {', '.join(alterations)}")
 
 
 def downgrade() -> None:
@@ -61,8 +64,9 @@ def downgrade() -> None:
 # Utility Function: Check for column existence
 def column_exists(table_name: str, column_name: str) -> bool:
     """Check if a column exists in a table."""
-    from sqlalchemy import inspect
     bind = op.get_bind()
-    inspector = inspect(bind)
-    columns = [col["name"] for col in inspector.get_columns(table_name)]
-    return column_name in columns
+    query = sa.text(
+        "SELECT EXISTS (SELECT 1 FROM information_schema.columns "
+        "WHERE table_schema = current_schema() AND table_name = :t AND column_name = :c)"
+    )
+    return bool(bind.execute(query, {"t": table_name, "c": column_name}).scalar())
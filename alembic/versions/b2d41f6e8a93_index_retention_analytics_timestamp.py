@@ -0,0 +1,28 @@
+"""Index retention_analytics.timestamp
+
+Revision ID: b2d41f6e8a93
+Revises: 7c3e9a1f2b64
+Create Date: 2024-12-20 11:05:47.902316
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'b2d41f6e8a93'
+down_revision: Union[str, None] = '7c3e9a1f2b64'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # ### Support newest-first reads of retention snapshots ###
+    op.create_index(
+        op.f('ix_retention_analytics_timestamp'), 'retention_analytics', ['timestamp'], unique=False
+    )
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_retention_analytics_timestamp'), table_name='retention_analytics')
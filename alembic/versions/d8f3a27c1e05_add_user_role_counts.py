@@ -0,0 +1,68 @@
+"""Add trigger-maintained user_role_counts table
+
+Revision ID: d8f3a27c1e05
+Revises: b2d41f6e8a93
+Create Date: 2024-12-20 14:31:09.277514
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'd8f3a27c1e05'
+down_revision: Union[str, None] = 'b2d41f6e8a93'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # ### Create the per-role counter table ###
+    op.create_table(
+        'user_role_counts',
+        sa.Column('role', sa.String(length=20), nullable=False),
+        sa.Column('total', sa.BigInteger(), server_default='0', nullable=False),
+        sa.PrimaryKeyConstraint('role')
+    )
+
+    # ### Keep it in step with users on every insert, delete and role change ###
+    # Trade-off: each signup, deletion or role change updates its role's single counter
+    # row inside the same transaction, so concurrent writes that touch the same role
+    # serialise on that row lock until they commit. Signup rates here are far below the
+    # point where that matters; if they grow, split each role over several slot rows
+    # (primary key (role, slot), slot picked per row) and sum them in _role_total().
+    op.execute("""
+        CREATE OR REPLACE FUNCTION adjust_user_role_counts() RETURNS trigger AS $$
+        BEGIN
+            IF TG_OP = 'UPDATE' AND OLD.role = NEW.role THEN
+                RETURN NULL;
+            END IF;
+            IF TG_OP IN ('UPDATE', 'DELETE') THEN
+                UPDATE user_role_counts SET total = total - 1 WHERE role = OLD.role::text;
+            END IF;
+            IF TG_OP IN ('INSERT', 'UPDATE') THEN
+                INSERT INTO user_role_counts (role, total) VALUES (NEW.role::text, 1)
+                ON CONFLICT (role) DO UPDATE SET total = user_role_counts.total + 1;
+            END IF;
+            RETURN NULL;
+        END;
+        $$ LANGUAGE plpgsql
+    """)
+    op.execute("""
+        CREATE TRIGGER users_role_counts
+        AFTER INSERT OR DELETE OR UPDATE OF role ON users
+        FOR EACH ROW EXECUTE FUNCTION adjust_user_role_counts()
+    """)
+
+    # ### Backfill from the existing users ###
+    op.execute("""
+        INSERT INTO user_role_counts (role, total)
+        SELECT role::text, count(*) FROM users GROUP BY role
+    """)
+
+
+def downgrade() -> None:
+    op.execute("DROP TRIGGER IF EXISTS users_role_counts ON users")
+    op.execute("DROP FUNCTION IF EXISTS adjust_user_role_counts()")
+    op.drop_table('user_role_counts')
@@ -0,0 +1,38 @@
+"""Store retention_analytics.conversion_rate as NUMERIC(5,2)
+
+Revision ID: e41b7c09d5a2
+Revises: d8f3a27c1e05
+Create Date: 2024-12-20 16:02:44.615830
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'e41b7c09d5a2'
+down_revision: Union[str, None] = 'd8f3a27c1e05'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # ### Convert "66.67%" strings into numeric percentages ###
+    op.alter_column(
+        'retention_analytics', 'conversion_rate',
+        existing_type=sa.String(length=10),
+        type_=sa.Numeric(precision=5, scale=2),
+        existing_nullable=False,
+        postgresql_using="rtrim(conversion_rate, '%')::numeric(5,2)",
+    )
+
+
+def downgrade() -> None:
+    op.alter_column(
+        'retention_analytics', 'conversion_rate',
+        existing_type=sa.Numeric(precision=5, scale=2),
+        type_=sa.String(length=10),
+        existing_nullable=False,
+        postgresql_using="to_char(conversion_rate, 'FM990.00') || '%'",
+    )
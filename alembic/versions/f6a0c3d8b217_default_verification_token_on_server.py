@@ -0,0 +1,36 @@
+"""Generate users.verification_token with a server default
+
+Revision ID: f6a0c3d8b217
+Revises: e41b7c09d5a2
+Create Date: 2024-12-21 09:40:18.330592
+
+"""
+from typing import Sequence, Union
+
+from alembic import op
+import sqlalchemy as sa
+
+# revision identifiers, used by Alembic.
+revision: str = 'f6a0c3d8b217'
+down_revision: Union[str, None] = 'e41b7c09d5a2'
+branch_labels: Union[str, Sequence[str], None] = None
+depends_on: Union[str, Sequence[str], None] = None
+
+
+def upgrade() -> None:
+    # ### gen_random_uuid() is built into PostgreSQL 13+ ###
+    op.alter_column(
+        'users', 'verification_token',
+        existing_type=sa.String(),
+        server_default=sa.text("gen_random_uuid()::text"),
+        existing_nullable=True,
+    )
+
+
+def downgrade() -> None:
+    op.alter_column(
+        'users', 'verification_token',
+        existing_type=sa.String(),
+        server_default=None,
+        existing_nullable=True,
+    )
@@ -1,4 +1,6 @@
 from builtins import Exception
+import asyncio
+import logging
 from fastapi import FastAPI
 from starlette.responses import JSONResponse
 from starlette.middleware.cors import CORSMiddleware
@@ -6,9 +8,12 @@ from app.database import Database, get_db
 from app.dependencies import get_settings
 from app.routers import user_routes
 from app.routers.user_routes import router as analytics_router  # Import analytics router
-from app.services.analytics_service import AnalyticsService  # Import the analytics service
+from app.services.analytics_service import AnalyticsService
+from app.services.user_service import wait_for_pending_emails
 from app.utils.api_description import getDescription
 
+logger = logging.getLogger(__name__)
+
 app = FastAPI(
     title="User Management",
     description=getDescription(),
@@ -30,11 +35,46 @@ app.add_middleware(
     allow_headers=["*"],  # Allow all HTTP headers
 )
 
-# Initialize database connection on startup
+async def run_periodically(interval: int, job):
+    """Run `job` with a fresh database session every `interval` seconds."""
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            async with get_db() as session:
+                await job(session)
+        except Exception as e:
+            logger.error(f"Background task {job.__name__} failed: {e}")
+
+# Initialize database connection and background tasks on startup
 @app.on_event("startup")
 async def startup_event():
     settings = get_settings()
-    Database.initialize(settings.database_url, settings.debug)
+    Database.initialize(
+        settings.database_url,
+        settings.debug,
+        pool_size=settings.db_pool_size,
+        max_overflow=settings.db_max_overflow,
+        pool_recycle=settings.db_pool_recycle,
+    )
+    app.state.background_tasks = [
+        asyncio.create_task(
+            run_periodically(settings.activity_flush_interval_seconds, AnalyticsService.flush_user_activity)
+        ),
+        asyncio.create_task(
+            run_periodically(settings.retention_snapshot_interval_seconds, AnalyticsService.calculate_retention_metrics)
+        ),
+    ]
+
+# Stop background tasks, write any remaining activity and finish sending emails on shutdown
+@app.on_event("shutdown")
+async def shutdown_event():
+    for task in app.state.background_tasks:
+        task.cancel()
+    # Let cancelled jobs unwind before the final flush
+    await asyncio.gather(*app.state.background_tasks, return_exceptions=True)
+    async with get_db() as session:
+        await AnalyticsService.flush_user_activity(session)
+    await wait_for_pending_emails()
 
 
 # Global exception handler
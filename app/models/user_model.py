@@ -1,9 +1,10 @@
 from builtins import bool, int, str
 from datetime import datetime, timezone
+from decimal import Decimal
 from enum import Enum
 import uuid
 from sqlalchemy import (
-    Column, String, Integer, DateTime, Boolean, func, Enum as SQLAlchemyEnum, ForeignKey
+    DDL, String, Integer, BigInteger, Numeric, DateTime, Boolean, event, func, text, ForeignKey
 )
 from sqlalchemy.dialects.postgresql import UUID, ENUM
 from sqlalchemy.orm import Mapped, mapped_column, relationship
@@ -54,29 +55,29 @@ class User(Base):
     __mapper_args__ = {"eager_defaults": True}
 
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    nickname: Mapped[str] = Column(String(50), unique=True, nullable=False, index=True)
-    email: Mapped[str] = Column(String(255), unique=True, nullable=False, index=True)
-    first_name: Mapped[str] = Column(String(100), nullable=True)
-    last_name: Mapped[str] = Column(String(100), nullable=True)
-    bio: Mapped[str] = Column(String(500), nullable=True)
-    profile_picture_url: Mapped[str] = Column(String(255), nullable=True)
-    linkedin_profile_url: Mapped[str] = Column(String(255), nullable=True)
-    github_profile_url: Mapped[str] = Column(String(255), nullable=True)
-    role: Mapped[UserRole] = Column(SQLAlchemyEnum(UserRole, name='UserRole', create_constraint=True), nullable=False)
-    is_professional: Mapped[bool] = Column(Boolean, default=False)
-    professional_status_updated_at: Mapped[datetime] = Column(DateTime(timezone=True), nullable=True)
-    last_login_at: Mapped[datetime] = Column(DateTime(timezone=True), nullable=True)
-    failed_login_attempts: Mapped[int] = Column(Integer, default=0)
-    is_locked: Mapped[bool] = Column(Boolean, default=False)
-    created_at: Mapped[datetime] = Column(DateTime(timezone=True), server_default=func.now())
-    updated_at: Mapped[datetime] = Column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now())
-    verification_token = Column(String, nullable=True)
-    email_verified: Mapped[bool] = Column(Boolean, default=False, nullable=False)
-    hashed_password: Mapped[str] = Column(String(255), nullable=False)
+    nickname: Mapped[str] = mapped_column(String(50), unique=True, nullable=False, index=True)
+    email: Mapped[str] = mapped_column(String(255), unique=True, nullable=False, index=True)
+    first_name: Mapped[str] = mapped_column(String(100), nullable=True)
+    last_name: Mapped[str] = mapped_column(String(100), nullable=True)
+    bio: Mapped[str] = mapped_column(String(500), nullable=True)
+    profile_picture_url: Mapped[str] = mapped_column(String(255), nullable=True)
+    linkedin_profile_url: Mapped[str] = mapped_column(String(255), nullable=True)
+    github_profile_url: Mapped[str] = mapped_column(String(255), nullable=True)
+    role: Mapped[UserRole] = mapped_column(ENUM(UserRole, name='UserRole', create_type=True), nullable=False, index=True)
+    is_professional: Mapped[bool] = mapped_column(Boolean, default=False, nullable=True)
+    professional_status_updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=True)
+    last_login_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), nullable=True, index=True)
+    failed_login_attempts: Mapped[int] = mapped_column(Integer, default=0, nullable=True)
+    is_locked: Mapped[bool] = mapped_column(Boolean, default=False, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), nullable=True)
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), onupdate=func.now(), nullable=True)
+    verification_token: Mapped[str] = mapped_column(String, server_default=text("gen_random_uuid()::text"), nullable=True)
+    email_verified: Mapped[bool] = mapped_column(Boolean, default=False, nullable=False)
+    hashed_password: Mapped[str] = mapped_column(String(255), nullable=False)
      # New fields for retention analytics
-    invited_by_user_id: Mapped[uuid.UUID] = Column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=True)
+    invited_by_user_id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), ForeignKey("users.id"), nullable=True)
     invited_by = relationship("User", remote_side="User.id", backref="invited_users")
-    is_converted: Mapped[bool] = Column(Boolean, default=False)
+    is_converted: Mapped[bool] = mapped_column(Boolean, default=False)
 
 
     def __repr__(self) -> str:
@@ -98,7 +99,7 @@ class User(Base):
     def update_professional_status(self, status: bool):
         """Updates the professional status and logs the update time."""
         self.is_professional = status
-        self.professional_status_updated_at = func.now()
+        self.professional_status_updated_at = datetime.now(timezone.utc)
 
     # New feature of retention analytics
     def update_last_login(self):
@@ -106,6 +107,53 @@ class User(Base):
         self.last_login_at = datetime.now(timezone.utc)
 
 
+class UserRoleCount(Base):
+    """
+    Running number of users per role, kept current by the
+    `users_role_counts` trigger on the users table. There is one row per
+    role, so concurrent user writes for the same role queue on its row lock
+    (see migration d8f3a27c1e05).
+    """
+    __tablename__ = "user_role_counts"
+
+    role: Mapped[str] = mapped_column(String(20), primary_key=True)
+    total: Mapped[int] = mapped_column(BigInteger, nullable=False, default=0)
+
+    def __repr__(self):
+        """Provides a readable representation of a role count."""
+        return f"<UserRoleCount {self.role}={self.total}>"
+
+
+# The counter trigger (also created by migration d8f3a27c1e05), attached to the users table so
+# schemas built with Base.metadata.create_all, such as the test database, keep counts too.
+# The function only resolves user_role_counts when it runs, so table creation order is irrelevant.
+event.listen(User.__table__, "after_create", DDL("""
+    CREATE OR REPLACE FUNCTION adjust_user_role_counts() RETURNS trigger AS $$
+    BEGIN
+        IF TG_OP = 'UPDATE' AND OLD.role = NEW.role THEN
+            RETURN NULL;
+        END IF;
+        IF TG_OP IN ('UPDATE', 'DELETE') THEN
+            UPDATE user_role_counts SET total = total - 1 WHERE role = OLD.role::text;
+        END IF;
+        IF TG_OP IN ('INSERT', 'UPDATE') THEN
+            INSERT INTO user_role_counts (role, total) VALUES (NEW.role::text, 1)
+            ON CONFLICT (role) DO UPDATE SET total = user_role_counts.total + 1;
+        END IF;
+        RETURN NULL;
+    END;
+    $$ LANGUAGE plpgsql
+""").execute_if(dialect="postgresql"))
+event.listen(User.__table__, "after_create", DDL("""
+    CREATE TRIGGER users_role_counts
+    AFTER INSERT OR DELETE OR UPDATE OF role ON users
+    FOR EACH ROW EXECUTE FUNCTION adjust_user_role_counts()
+""").execute_if(dialect="postgresql"))
+event.listen(User.__table__, "after_drop", DDL(
+    "DROP FUNCTION IF EXISTS adjust_user_role_counts()"
+).execute_if(dialect="postgresql"))
+
+
 class RetentionAnalytics(Base):
     """
     Tracks user retention analytics.
@@ -113,11 +161,11 @@ class RetentionAnalytics(Base):
     __tablename__ = "retention_analytics"
 
     id: Mapped[uuid.UUID] = mapped_column(UUID(as_uuid=True), primary_key=True, default=uuid.uuid4)
-    timestamp: Mapped[datetime] = Column(DateTime(timezone=True), default=datetime.now(timezone.utc))
-    total_anonymous_users: Mapped[int] = Column(Integer, default=0)
-    total_authenticated_users: Mapped[int] = Column(Integer, default=0)
-    conversion_rate: Mapped[str] = Column(String(10), nullable=False)  # Example: "20%"
-    inactive_users_24hr: Mapped[int] = Column(Integer, default=0)
+    timestamp: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.now(), index=True)
+    total_anonymous_users: Mapped[int] = mapped_column(Integer, default=0)
+    total_authenticated_users: Mapped[int] = mapped_column(Integer, default=0)
+    conversion_rate: Mapped[Decimal] = mapped_column(Numeric(5, 2), nullable=False)  # Percentage, e.g. 20.00
+    inactive_users_24hr: Mapped[int] = mapped_column(Integer, default=0)
 
     def __repr__(self):
         """Provides a readable representation of analytics data."""
@@ -125,5 +173,5 @@ class RetentionAnalytics(Base):
             f"<RetentionAnalytics {self.timestamp}: "
             f"Anonymous={self.total_anonymous_users}, "
             f"Authenticated={self.total_authenticated_users}, "
-            f"Conversion={self.conversion_rate}>"
+            f"Conversion={self.conversion_rate}%>"
         )
\ No newline at end of file
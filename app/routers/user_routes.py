@@ -20,22 +20,22 @@ Key Highlights:
 
 from builtins import dict, int, len, str
 from datetime import timedelta
+from typing import Optional
 from uuid import UUID
 import app
-from app.services.analytics_service import AnalyticsService
 from fastapi import APIRouter, Depends, HTTPException, Query, Response, status, Request
 from fastapi.security import OAuth2PasswordBearer, OAuth2PasswordRequestForm
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.future import select
 from app.dependencies import get_current_user, get_db, get_email_service, require_role, get_settings
-from app.models.user_model import RetentionAnalytics, User, UserRole
+from app.models.user_model import User, UserRole
 from app.schemas.pagination_schema import EnhancedPagination
 from app.schemas.token_schema import TokenResponse
 from app.schemas.user_schemas import LoginRequest, UserBase, UserCreate, UserListResponse, UserResponse, UserSearchRequest, UserUpdate
-from app.services.analytics_service import AnalyticsService 
 from app.services.user_service import UserService
+from app.services.analytics_service import AnalyticsService
 from app.services.jwt_service import create_access_token
-from app.utils.link_generation import create_user_links, generate_pagination_links
+from app.utils.link_generation import create_user_links, generate_keyset_pagination_links, generate_pagination_links
 from app.dependencies import get_settings
 from app.services.email_service import EmailService
 
@@ -93,7 +93,7 @@ async def update_user(user_id: UUID, user_update: UserUpdate, request: Request,
     - **user_id**: UUID of the user to update.
     - **user_update**: UserUpdate model with updated user information.
     """
-    updated_user = await UserService.update(db, user_id, user_update.model_dump(), current_user)
+    updated_user = await UserService.update(db, user_id, user_update, current_user)
     if not updated_user:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="User not found or unauthorized action.")
 
@@ -150,7 +150,7 @@ async def create_user(user: UserCreate, request: Request, db: AsyncSession = Dep
     if existing_user:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Email already exists")
     
-    created_user = await UserService.create(db, user.model_dump(), email_service)
+    created_user = await UserService.create(db, user, email_service)
     if not created_user:
         raise HTTPException(status_code=status.HTTP_500_INTERNAL_SERVER_ERROR, detail="Failed to create user")
     
@@ -176,17 +176,23 @@ async def list_users(
     request: Request,
     skip: int = 0,
     limit: int = 10,
+    after_id: Optional[UUID] = None,
     db: AsyncSession = Depends(get_db),
     current_user: dict = Depends(require_role(["ADMIN", "MANAGER"]))
 ):
     total_users = await UserService.count(db)
-    users = await UserService.list_users(db, skip, limit)
+    users = await UserService.list_users(db, skip, limit, after_id=after_id)
 
     user_responses = [
         UserResponse.model_validate(user) for user in users
     ]
     
-    pagination_links = generate_pagination_links(request, skip, limit, total_users)
+    # Users are ordered by id, so a full page's last id is the cursor for the next one
+    next_after_id = users[-1].id if len(users) == limit else None
+    if after_id is not None:
+        pagination_links = generate_keyset_pagination_links(request, after_id, limit, next_after_id)
+    else:
+        pagination_links = generate_pagination_links(request, skip, limit, total_users)
     
     # Construct the final response with pagination details
     return UserListResponse(
@@ -194,13 +200,14 @@ async def list_users(
         total=total_users,
         page=skip // limit + 1,
         size=len(user_responses),
-        links=pagination_links  # Ensure you have appropriate logic to create these links
+        links=pagination_links,
+        next_after_id=next_after_id,
     )
 
 
 @router.post("/register/", response_model=UserResponse, tags=["Login and Registration"])
 async def register(user_data: UserCreate, session: AsyncSession = Depends(get_db), email_service: EmailService = Depends(get_email_service)):
-    user = await UserService.register_user(session, user_data.model_dump(), email_service)
+    user = await UserService.register_user(session, user_data, email_service)
     if user:
         return user
     raise HTTPException(status_code=400, detail="Email already exists")
@@ -222,33 +229,14 @@ async def login(form_data: OAuth2PasswordRequestForm = Depends(), session: Async
         return {"access_token": access_token, "token_type": "bearer"}
     raise HTTPException(status_code=401, detail="Incorrect email or password.")
 
-@staticmethod
-async def get_retention_data(db: AsyncSession):
-    """Retrieve the most recent retention analytics data."""
-    result = await db.execute(
-        select(RetentionAnalytics).order_by(RetentionAnalytics.timestamp.desc())
-    )
-    retention_records = result.scalars().all()
-    
-    # Convert to a list of dictionaries
-    return [
-        {
-            "timestamp": record.timestamp.isoformat(),
-            "total_anonymous_users": record.total_anonymous_users,
-            "total_authenticated_users": record.total_authenticated_users,
-            "conversion_rate": record.conversion_rate,
-            "inactive_users_24hr": record.inactive_users_24hr,
-        }
-        for record in retention_records
-    ]
-
-
 @router.get("/analytics/retention", name="get_retention_metrics", tags=["Analytics"])
-async def get_retention_metrics(db: AsyncSession = Depends(get_db)):
+async def get_retention_metrics(limit: int = Query(24, ge=1, le=1000), db: AsyncSession = Depends(get_db)):
     """
-    Retrieve retention analytics data.
+    Retrieve the most recent retention analytics snapshots.
+
+    - **limit**: Maximum number of snapshots to return, newest first.
     """
-    retention_data = await AnalyticsService.get_retention_data(db)
+    retention_data = await AnalyticsService.get_retention_data(db, limit)
     return {"data": retention_data}
 
 @router.get("/verify-email/{user_id}/{token}", status_code=status.HTTP_200_OK, name="verify_email", tags=["Login and Registration"])
@@ -6,6 +6,7 @@ from enum import Enum
 import uuid
 import re
 from app.models.user_model import UserRole
+from app.schemas.pagination_schema import PaginationLink
 from app.utils.nickname_gen import generate_nickname
 
 
@@ -88,6 +89,8 @@ class UserListResponse(BaseModel):
     total: int = Field(..., example=100)
     page: int = Field(..., example=1)
     size: int = Field(..., example=10)
+    links: List[PaginationLink] = []
+    next_after_id: Optional[uuid.UUID] = Field(None, description="Pass as after_id to fetch the next page; null on the last page.")
 
 
 # New schema for search criteria
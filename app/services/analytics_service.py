@@ -1,29 +1,89 @@
-from unittest.mock import AsyncMock
+from typing import Dict
+from sqlalchemy import bindparam, exists, insert, update
 from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.sql import func, select
 from datetime import datetime, timezone, timedelta
-from app.models.user_model import User, RetentionAnalytics
+from app.dependencies import get_settings
+from app.models.user_model import User, UserRole, UserRoleCount, RetentionAnalytics
 from uuid import UUID
 
+__all__ = ["AnalyticsService"]
+
+settings = get_settings()
+
+# Last login timestamps waiting to be written, keyed by user id
+_pending_logins: Dict[UUID, datetime] = {}
+
+# Advisory lock key serialising retention snapshots across workers
+_RETENTION_SNAPSHOT_LOCK = 7_310_001
+
+
+def _role_total(role: UserRole):
+    """Scalar subquery reading the trigger-maintained user count for a role."""
+    return (
+        select(UserRoleCount.total)
+        .where(UserRoleCount.role == role.value)
+        .scalar_subquery()
+    )
+
+
+def _snapshot_period_start():
+    """Start of the current snapshot period: now() floored to a multiple of the snapshot interval."""
+    interval = settings.retention_snapshot_interval_seconds
+    return func.to_timestamp(func.floor(func.extract("epoch", func.now()) / interval) * interval)
+
 
 class AnalyticsService:
     @staticmethod
     async def log_user_activity(user_id: UUID, db: AsyncSession):
-        """Update the last login timestamp for a user."""
-        user = await db.get(User, user_id)
-        if user:
-            now = datetime.now(timezone.utc)
-            user.last_login_at = now
-            db.add(user)
-            await db.commit()
+        """
+        Buffer the last login timestamp for a user, flushing once the batch is full.
+
+        Nothing in the app calls this yet: login_user stamps last_login_at in the UPDATE it
+        already runs for the failed-attempt counter, so buffering there would save nothing.
+        It is kept for activity tracking outside login, which the flush loop in main serves.
+        """
+        _pending_logins[user_id] = datetime.now(timezone.utc)
+        if len(_pending_logins) >= settings.activity_flush_batch_size:
+            await AnalyticsService.flush_user_activity(db)
 
     @staticmethod
-    async def get_retention_data(db: AsyncSession):
-        """Retrieve the most recent retention analytics data."""
+    async def flush_user_activity(db: AsyncSession) -> int:
+        """
+        Write all buffered last login timestamps in a single batched UPDATE.
+
+        Entries leave the buffer only once the UPDATE is committed, so a failed or cancelled
+        flush keeps them for the next one.
+        """
+        if not _pending_logins:
+            return 0
+
+        rows = [{"user_id": user_id, "ts": ts} for user_id, ts in _pending_logins.items()]
+
+        users = User.__table__
+        query = (
+            update(users)
+            .where(users.c.id == bindparam("user_id"))
+            .values(last_login_at=bindparam("ts"))
+        )
+        await db.execute(query, rows)
+        await db.commit()
+
+        # Keep timestamps logged while the flush was in flight
+        for row in rows:
+            if _pending_logins.get(row["user_id"]) == row["ts"]:
+                del _pending_logins[row["user_id"]]
+        return len(rows)
+
+    @staticmethod
+    async def get_retention_data(db: AsyncSession, limit: int = 24):
+        """Retrieve the `limit` most recent retention analytics snapshots."""
         result = await db.execute(
-            select(RetentionAnalytics).order_by(RetentionAnalytics.timestamp.desc())
+            select(RetentionAnalytics)
+            .order_by(RetentionAnalytics.timestamp.desc())
+            .limit(limit)
         )
-        retention_records = await result.scalars().all()  # Await the coroutine
+        retention_records = result.scalars().all()
 
         # Convert RetentionAnalytics objects to dictionaries
         return [
@@ -31,7 +91,7 @@ class AnalyticsService:
                 "timestamp": record.timestamp.isoformat(),
                 "total_anonymous_users": record.total_anonymous_users,
                 "total_authenticated_users": record.total_authenticated_users,
-                "conversion_rate": record.conversion_rate,
+                "conversion_rate": float(record.conversion_rate),
                 "inactive_users_24hr": record.inactive_users_24hr,
             }
             for record in retention_records
@@ -42,34 +102,52 @@ class AnalyticsService:
 
     @staticmethod
     async def calculate_retention_metrics(db: AsyncSession):
-        """Calculate retention metrics and save them into the database."""
+        """
+        Calculate retention metrics and save them into the database, at most once per
+        snapshot period (`retention_snapshot_interval_seconds`).
+
+        Every worker runs this job, so it first takes a transaction-level advisory lock and
+        then checks, in a statement that starts after the lock is held, whether another
+        worker already saved this period's snapshot.
+        """
+        if not await db.scalar(select(func.pg_try_advisory_xact_lock(_RETENTION_SNAPSHOT_LOCK))):
+            return  # Another worker is saving a snapshot right now
+        if await db.scalar(select(exists().where(RetentionAnalytics.timestamp >= _snapshot_period_start()))):
+            await db.rollback()  # Release the lock
+            return
+
         now = datetime.now(timezone.utc)
 
-        # Count total anonymous and authenticated users
-        total_anonymous = await db.scalar(select(func.count()).where(User.role == "ANONYMOUS"))
-        total_authenticated = await db.scalar(select(func.count()).where(User.role == "AUTHENTICATED"))
+        # Role totals come from user_role_counts; only the inactivity window
+        # needs a (last_login_at index) range count over users.
+        query = select(
+            _role_total(UserRole.ANONYMOUS),
+            _role_total(UserRole.AUTHENTICATED),
+            select(func.count())
+            .where(User.last_login_at < now - timedelta(hours=24))
+            .scalar_subquery(),
+        )
+        result = await db.execute(query)
+        total_anonymous, total_authenticated, inactive_24hr = result.one()
+        total_anonymous = total_anonymous or 0
+        total_authenticated = total_authenticated or 0
 
         # Calculate conversion rate
         conversion_rate = (
-            f"{(total_authenticated / (total_anonymous + total_authenticated) * 100):.2f}%"
+            round(total_authenticated / (total_anonymous + total_authenticated) * 100, 2)
             if (total_anonymous + total_authenticated) > 0
-            else "0%"
-        )
-
-        # Identify inactive users based on last login time
-        inactive_24hr = await db.scalar(
-            select(func.count()).where(User.last_login_at < now - timedelta(hours=24))
+            else 0
         )
 
-        # Construct and save analytics metrics
-        analytics = RetentionAnalytics(
-            total_anonymous_users=total_anonymous or 0,
-            total_authenticated_users=total_authenticated or 0,
-            conversion_rate=conversion_rate,
-            inactive_users_24hr=inactive_24hr or 0,
+        # Save the snapshot with a Core INSERT; the row is never read back
+        await db.execute(
+            insert(RetentionAnalytics).values(
+                total_anonymous_users=total_anonymous,
+                total_authenticated_users=total_authenticated,
+                conversion_rate=conversion_rate,
+                inactive_users_24hr=inactive_24hr or 0,
+            )
         )
-
-        db.add(analytics)
         await db.commit()
 
 
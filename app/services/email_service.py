@@ -1,4 +1,5 @@
 # email_service.py
+import asyncio
 from builtins import ValueError, dict, str
 from settings.config import settings
 from app.utils.smtp_connection import SMTPClient
@@ -26,7 +27,10 @@ class EmailService:
             raise ValueError("Invalid email type")
 
         html_content = self.template_manager.render_template(email_type, **user_data)
-        self.smtp_client.send_email(subject_map[email_type], html_content, user_data['email'])
+        # smtplib blocks, so keep it off the event loop
+        await asyncio.get_running_loop().run_in_executor(
+            None, self.smtp_client.send_email, subject_map[email_type], html_content, user_data['email']
+        )
 
     async def send_verification_email(self, user: User):
         verification_url = f"{settings.server_base_url}verify-email/{user.id}/{user.verification_token}"
@@ -1,16 +1,17 @@
 from builtins import Exception, bool, classmethod, int, str
+import asyncio
 from datetime import datetime, timezone
 import secrets
-from typing import Any, Optional, Dict, List
+from typing import Any, Awaitable, Optional, Dict, List, Set, Union
 from pydantic import ValidationError
-from sqlalchemy import func, null, update, select
-from sqlalchemy.exc import SQLAlchemyError
+from sqlalchemy import bindparam, case, delete, exists, func, inspect, literal, null, update, select
+from sqlalchemy.exc import IntegrityError, SQLAlchemyError
 from sqlalchemy.ext.asyncio import AsyncSession
 from app.dependencies import get_email_service, get_settings
 from app.models.user_model import User, UserRole
 from app.schemas.user_schemas import UserCreate, UserUpdate
 from app.utils.nickname_gen import generate_nickname
-from app.utils.security import generate_verification_token, hash_password, verify_password
+from app.utils.security import hash_password_async, verify_password_async
 from uuid import UUID
 from pydantic import ValidationError
 from app.services.email_service import EmailService
@@ -19,12 +20,56 @@ import logging
 settings = get_settings()
 logger = logging.getLogger(__name__)
 
+# Attempts at drawing a nickname that isn't taken before giving up on creation
+NICKNAME_ATTEMPTS = 5
+
+# Unique index on users.nickname; only violations of this one are worth retrying
+_NICKNAME_INDEX = "ix_users_nickname"
+
+# session.info key for users already loaded by email within that session
+_USERS_BY_EMAIL = "users_by_email"
+
+# Checked against on login misses so they cost the same as a real password check; a fixed
+# bcrypt hash at the default cost of 12 rounds, so importing the module does no hashing
+_DUMMY_HASH = "$2b$12$LDdnkjVgdrAX6wRHAfvVWOXvXqreC4r7lqckAk5eUE10Ptbi49mMq"
+
+# Single-user lookups, built once at import; the value is bound as "v" per call
+_STMT_BY_EMAIL = select(User).where(User.email == bindparam("v"))
+_STMT_BY_NICKNAME = select(User).where(User.nickname == bindparam("v"))
+
+# Emails sent in the background; referenced here so the tasks are not garbage collected
+_email_tasks: Set[asyncio.Task] = set()
+
+
+def _violated_constraint(error: IntegrityError) -> Optional[str]:
+    """Name of the constraint behind an IntegrityError, from the asyncpg error it wraps."""
+    return getattr(error.orig.__cause__, "constraint_name", None)
+
+
+def _log_email_failure(task: asyncio.Task) -> None:
+    _email_tasks.discard(task)
+    if not task.cancelled() and task.exception() is not None:
+        logger.error(f"Failed to send email: {task.exception()}")
+
+
+def _send_in_background(send: Awaitable) -> None:
+    """Send an email without making the request wait on the mail server."""
+    task = asyncio.create_task(send)
+    _email_tasks.add(task)
+    task.add_done_callback(_log_email_failure)
+
+
+async def wait_for_pending_emails() -> None:
+    """Wait for background email sends still in flight, e.g. before shutting down."""
+    if _email_tasks:
+        await asyncio.gather(*_email_tasks, return_exceptions=True)
+
 class UserService:
     @classmethod
-    async def _execute_query(cls, session: AsyncSession, query):
+    async def _execute_query(cls, session: AsyncSession, query, params: Optional[Dict[str, Any]] = None):
+        """Run a read-only query; callers that write commit explicitly."""
         try:
-            result = await session.execute(query)
-            await session.commit()
+            result = await session.execute(query, params)
             return result
         except SQLAlchemyError as e:
             logger.error(f"Database error: {e}")
@@ -32,59 +77,85 @@ class UserService:
             return None
 
     @classmethod
-    async def _fetch_user(cls, session: AsyncSession, **filters) -> Optional[User]:
-        query = select(User).filter_by(**filters)
-        result = await cls._execute_query(session, query)
+    async def _fetch_user(cls, session: AsyncSession, query, value) -> Optional[User]:
+        result = await cls._execute_query(session, query, {"v": value})
         return result.scalars().first() if result else None
 
     @classmethod
     async def get_by_id(cls, session: AsyncSession, user_id: UUID) -> Optional[User]:
-        return await cls._fetch_user(session, id=user_id)
+        # Served from the identity map when this session already holds the user
+        try:
+            return await session.get(User, user_id)
+        except SQLAlchemyError as e:
+            logger.error(f"Database error: {e}")
+            await session.rollback()
+            return None
 
     @classmethod
     async def get_by_nickname(cls, session: AsyncSession, nickname: str) -> Optional[User]:
-        return await cls._fetch_user(session, nickname=nickname)
+        return await cls._fetch_user(session, _STMT_BY_NICKNAME, nickname)
 
     @classmethod
     async def get_by_email(cls, session: AsyncSession, email: str) -> Optional[User]:
-        return await cls._fetch_user(session, email=email)
+        """Fetch a user by email, reusing the instance this session already loaded for it."""
+        user = cls._loaded_user_by_email(session, email)
+        if user is not None:
+            return user
+        user = await cls._fetch_user(session, _STMT_BY_EMAIL, email)
+        if user is not None:
+            session.info.setdefault(_USERS_BY_EMAIL, {})[email] = user
+        return user
+
+    @staticmethod
+    def _loaded_user_by_email(session: AsyncSession, email: str) -> Optional[User]:
+        """Return the user this session already loaded for `email`, if it is still usable as is."""
+        user = session.info.get(_USERS_BY_EMAIL, {}).get(email)
+        if user is None:
+            return None
+        state = inspect(user)
+        # rollback() expires instances even with expire_on_commit=False, and reading an
+        # expired attribute would need a lazy load, which AsyncSession cannot do
+        if not state.persistent or state.expired_attributes or user.email != email:
+            return None
+        return user
 
     @classmethod
-    async def create(cls, session: AsyncSession, user_data: Dict[str, str], email_service: EmailService) -> Optional[User]:
+    async def create(cls, session: AsyncSession, user_data: Union[UserCreate, Dict[str, str]], email_service: EmailService) -> Optional[User]:
         try:
-            validated_data = UserCreate(**user_data).model_dump()
-            existing_user = await cls.get_by_email(session, validated_data['email'])
-            if existing_user:
+            # Routes hand over the UserCreate FastAPI already validated; only raw dicts need validating
+            user_create = user_data if isinstance(user_data, UserCreate) else UserCreate(**user_data)
+            validated_data = user_create.model_dump()
+
+            # Check the email and whether any user exists yet in one round-trip
+            query = select(
+                exists().where(User.email == validated_data['email']),
+                exists().select_from(User),
+            )
+            email_taken, users_exist = (await session.execute(query)).one()
+            if email_taken:
                 logger.error("User with given email already exists.")
                 return None
             
             # Hash the password
-            validated_data['hashed_password'] = hash_password(validated_data.pop('password'))
+            validated_data['hashed_password'] = await hash_password_async(validated_data.pop('password'))
             
             # Create user object
             new_user = User(**validated_data)
 
-            # Generate a unique nickname
-            new_nickname = generate_nickname()
-            while await cls.get_by_nickname(session, new_nickname):
-                new_nickname = generate_nickname()
-            new_user.nickname = new_nickname
-
             # Assign role: First user as ADMIN, others as ANONYMOUS
-            user_count = await cls.count(session)
-            new_user.role = UserRole.ADMIN if user_count == 0 else UserRole.ANONYMOUS
+            new_user.role = UserRole.ANONYMOUS if users_exist else UserRole.ADMIN
             if new_user.role == UserRole.ADMIN:
                 new_user.email_verified = True
 
-            # Generate verification token
-            new_user.verification_token = generate_verification_token()
-
-            # Save to DB
-            session.add(new_user)
+            # Save to DB under a generated nickname that the unique index accepts; the
+            # verification token is generated by the column's server default and
+            # returned by the INSERT (eager_defaults)
+            if not await cls._insert_with_unique_nickname(session, new_user):
+                return None
             await session.commit()
 
             # Send verification email
-            await email_service.send_verification_email(new_user)
+            _send_in_background(email_service.send_verification_email(new_user))
 
             return new_user
         except ValidationError as e:
@@ -92,14 +163,37 @@ class UserService:
             return None
 
     @classmethod
-    async def update(cls, session: AsyncSession, user_id: UUID, update_data: Dict[str, Optional[str]], current_user: dict) -> Optional[User]:
+    async def _insert_with_unique_nickname(cls, session: AsyncSession, user: User) -> bool:
+        """
+        Insert a new user under a freshly generated nickname, retrying on collisions.
+
+        Each attempt runs in a savepoint so that a duplicate nickname rejected by the
+        unique index only rolls back that attempt, not the surrounding transaction.
+        """
+        for _ in range(NICKNAME_ATTEMPTS):
+            user.nickname = generate_nickname()
+            try:
+                async with session.begin_nested():
+                    session.add(user)
+                return True
+            except IntegrityError as e:
+                if _violated_constraint(e) != _NICKNAME_INDEX:
+                    logger.error(f"Could not insert user: {e.orig}")
+                    return False
+                logger.info(f"Insert rejected for nickname {user.nickname}, retrying: {e.orig}")
+        logger.error("Could not insert user with a unique nickname.")
+        return False
+
+    @classmethod
+    async def update(cls, session: AsyncSession, user_id: UUID, update_data: Union[UserUpdate, Dict[str, Optional[str]]], current_user: dict) -> Optional[User]:
         """
         Updates user data, allowing role changes only by ADMIN users.
 
         Args:
             session: Database session.
             user_id: ID of the user to be updated.
-            update_data: Data for the update (None values are ignored).
+            update_data: Data for the update (None values are ignored). A UserUpdate
+                instance is trusted as already validated.
             current_user: User performing the update (must have ADMIN role for role changes).
 
         Returns:
@@ -107,17 +201,23 @@ class UserService:
         """
         try:
             # Step 1: Clean update_data by removing None values
-            cleaned_data = {key: value for key, value in update_data.items() if value is not None}
+            if isinstance(update_data, UserUpdate):
+                cleaned_data = update_data.model_dump(exclude_none=True)
+            else:
+                cleaned_data = {key: value for key, value in update_data.items() if value is not None}
             if not cleaned_data:
                 logger.error("No valid fields provided for update.")
                 return None
 
-            # Step 2: Validate the cleaned data
-            try:
-                validated_data = UserUpdate(**cleaned_data).model_dump(exclude_unset=True)
-            except ValidationError as e:
-                logger.error(f"Validation error: {e}")
-                return None
+            # Step 2: Validate the cleaned data, unless it came from a validated UserUpdate
+            if isinstance(update_data, UserUpdate):
+                validated_data = cleaned_data
+            else:
+                try:
+                    validated_data = UserUpdate(**cleaned_data).model_dump(exclude_unset=True)
+                except ValidationError as e:
+                    logger.error(f"Validation error: {e}")
+                    return None
 
             logger.info(f"Updating user {user_id} with data: {validated_data}")
 
@@ -126,22 +226,21 @@ class UserService:
                 logger.error("Unauthorized role update attempt.")
                 return None
 
-            # Step 4: Perform the update
+            # Step 4: Perform the update, returning the updated row in the same round-trip
             query = (
                 update(User)
                 .where(User.id == user_id)
                 .values(**validated_data)
-                .execution_options(synchronize_session="fetch")
+                .returning(User)
+                .execution_options(populate_existing=True)
             )
             result = await session.execute(query)
+            updated_user = result.scalar_one_or_none()
             await session.commit()
 
-            # Step 5: Fetch and return the updated user
-            if result.rowcount > 0:  # Ensure a row was updated
-                updated_user = await cls.get_by_id(session, user_id)
-                if updated_user:
-                    session.refresh(updated_user)  # Ensure updated data
-                    return updated_user
+            # Step 5: Return the updated user
+            if updated_user:
+                return updated_user
 
             logger.error(f"User {user_id} not found or update failed.")
             return None
@@ -154,46 +253,71 @@ class UserService:
 
     @classmethod
     async def delete(cls, session: AsyncSession, user_id: UUID) -> bool:
-        user = await cls.get_by_id(session, user_id)
-        if not user:
+        try:
+            # Detach users this user invited, as the ORM cascade did, then delete by key
+            await session.execute(
+                update(User).where(User.invited_by_user_id == user_id).values(invited_by_user_id=None)
+            )
+            result = await session.execute(delete(User).where(User.id == user_id))
+            await session.commit()
+        except SQLAlchemyError as e:
+            logger.error(f"Database error: {e}")
+            await session.rollback()
+            return False
+        if result.rowcount == 0:
             logger.info(f"User with ID {user_id} not found.")
             return False
-        await session.delete(user)
-        await session.commit()
         return True
 
     @classmethod
-    async def list_users(cls, session: AsyncSession, skip: int = 0, limit: int = 10) -> List[User]:
-        query = select(User).offset(skip).limit(limit)
+    async def list_users(cls, session: AsyncSession, skip: int = 0, limit: int = 10, after_id: Optional[UUID] = None) -> List[User]:
+        """
+        List users ordered by id.
+
+        Pass `after_id` (the last id of the previous page) for keyset pagination, which seeks
+        the primary key index instead of reading and discarding `skip` rows.
+        """
+        query = select(User).order_by(User.id).limit(limit)
+        if after_id is not None:
+            query = query.where(User.id > after_id)
+        else:
+            query = query.offset(skip)
         result = await cls._execute_query(session, query)
         return result.scalars().all() if result else []
 
     @classmethod
-    async def register_user(cls, session: AsyncSession, user_data: Dict[str, str], get_email_service) -> Optional[User]:
+    async def register_user(cls, session: AsyncSession, user_data: Union[UserCreate, Dict[str, str]], get_email_service) -> Optional[User]:
         return await cls.create(session, user_data, get_email_service)
     
 
     @classmethod
     async def login_user(cls, session: AsyncSession, email: str, password: str) -> Optional[User]:
         user = await cls.get_by_email(session, email)
-        if user:
-            if user.email_verified is False:
-                return None
-            if user.is_locked:
-                return None
-            if verify_password(password, user.hashed_password):
-                user.failed_login_attempts = 0
-                user.last_login_at = datetime.now(timezone.utc)
-                session.add(user)
-                await session.commit()
-                return user
-            else:
-                user.failed_login_attempts += 1
-                if user.failed_login_attempts >= settings.max_login_attempts:
-                    user.is_locked = True
-                session.add(user)
-                await session.commit()
-        return None
+        if user is None or user.email_verified is False or user.is_locked:
+            # Pay the same bcrypt cost as a real check so response time does not
+            # reveal whether the account exists, is unverified or is locked
+            await verify_password_async(password, _DUMMY_HASH)
+            return None
+        authenticated = await verify_password_async(password, user.hashed_password)
+        if authenticated:
+            changes = {"failed_login_attempts": 0, "last_login_at": datetime.now(timezone.utc)}
+        else:
+            # Count the failure in SQL so concurrent attempts cannot overwrite each other
+            attempts = func.coalesce(User.failed_login_attempts, 0) + 1
+            changes = {
+                "failed_login_attempts": attempts,
+                "is_locked": attempts >= settings.max_login_attempts,
+            }
+        query = (
+            update(User)
+            .where(User.id == user.id)
+            .values(**changes)
+            .returning(User)
+            .execution_options(populate_existing=True)
+        )
+        user = (await session.execute(query)).scalar_one()
+        await session.commit()
+        return user if authenticated else None
     
     @classmethod
     async def invite_user(cls, session: AsyncSession, email: str, inviter_id: UUID, email_service: Any) -> bool:
@@ -210,23 +334,19 @@ class UserService:
             True if the invitation was successfully sent, False otherwise.
         """
         try:
-            # Generate a verification token
-            invitation_token = generate_verification_token()
-            
-            # Create a new user with invited_by_user_id and token
+            # Create a new user with invited_by_user_id; the database generates the token
             user = User(
                 email=email,
                 invited_by_user_id=inviter_id,
-                verification_token=invitation_token
             )
             session.add(user)
             await session.commit()
 
             # Send the invitation email
-            invite_link = f"{get_settings().server_base_url}/register?token={invitation_token}"
-            await email_service.send_user_email(
+            invite_link = f"{settings.server_base_url}/register?token={user.verification_token}"
+            _send_in_background(email_service.send_user_email(
                 {"email": email, "invitation_link": invite_link}, "invitation"
-            )
+            ))
             return True
         except Exception as e:
             logger.error(f"Failed to invite user: {e}")
@@ -235,40 +355,46 @@ class UserService:
 
     @classmethod
     async def is_account_locked(cls, session: AsyncSession, email: str) -> bool:
+        # Loads the full user so the login route's following login_user reuses it from
+        # the session's email cache instead of selecting the same row again
         user = await cls.get_by_email(session, email)
-        return user.is_locked if user else False
+        return bool(user.is_locked) if user else False
 
 
     @classmethod
     async def reset_password(cls, session: AsyncSession, user_id: UUID, new_password: str) -> bool:
-        hashed_password = hash_password(new_password)
+        hashed_password = await hash_password_async(new_password)
         user = await cls.get_by_id(session, user_id)
         if user:
             user.hashed_password = hashed_password
             user.failed_login_attempts = 0  # Resetting failed login attempts
             user.is_locked = False  # Unlocking the user account, if locked
-            session.add(user)
             await session.commit()
             return True
         return False
 
     @classmethod
     async def verify_email_with_token(cls, session: AsyncSession, user_id: UUID, token: str) -> bool:
-        user = await session.get(User, user_id)
-        if user is None:
+        # Match the token in SQL so a wrong token never loads the row; promote
+        # ANONYMOUS users to AUTHENTICATED in the same statement.
+        query = (
+            update(User)
+            .where(User.id == user_id, User.verification_token == token)
+            .values(
+                email_verified=True,
+                verification_token=None,  # Clear the token once used
+                role=case(
+                    (User.role == UserRole.ANONYMOUS, literal(UserRole.AUTHENTICATED, User.role.type)),
+                    else_=User.role,
+                ),
+            )
+            .returning(User.id)
+        )
+        result = await session.execute(query)
+        if result.scalar_one_or_none() is None:
             return False
-        
-        if user.verification_token == token:
-            user.email_verified = True
-            user.verification_token = None  # Clear the token once used
-
-            if user.role == UserRole.ANONYMOUS:
-                user.role = UserRole.AUTHENTICATED
-
-            session.add(user)
-            await session.commit()  # Commit changes
-            return True
-        return False
+        await session.commit()
+        return True
 
     @classmethod
     async def count(cls, session: AsyncSession) -> int:
@@ -289,7 +415,6 @@ class UserService:
         if user and user.is_locked:
             user.is_locked = False
             user.failed_login_attempts = 0  # Optionally reset failed login attempts
-            session.add(user)
             await session.commit()
             return True
         return False
@@ -1,5 +1,5 @@
 from builtins import dict, int, max, str
-from typing import List, Callable
+from typing import List, Callable, Optional
 from urllib.parse import urlencode
 from uuid import UUID
 
@@ -31,7 +31,7 @@ def create_user_links(user_id: UUID, request: Request) -> List[Link]:
     ]
 
 def generate_pagination_links(request: Request, skip: int, limit: int, total_items: int) -> List[PaginationLink]:
-    base_url = str(request.url)
+    base_url = str(request.url).split("?")[0]  # Drop the request's own skip/limit
     total_pages = (total_items + limit - 1) // limit
     links = [
         create_pagination_link("self", base_url, {'skip': skip, 'limit': limit}),
@@ -46,3 +46,20 @@ def generate_pagination_links(request: Request, skip: int, limit: int, total_ite
         links.append(create_pagination_link("prev", base_url, {'skip': max(skip - limit, 0), 'limit': limit}))
 
     return links
+
+def generate_keyset_pagination_links(request: Request, after_id: Optional[UUID], limit: int, next_after_id: Optional[UUID]) -> List[PaginationLink]:
+    """
+    Links for keyset pagination, where pages are addressed by the last id seen rather than an
+    offset. There is no "prev" or "last": a cursor only seeks forward from a known id.
+    """
+    base_url = str(request.url).split("?")[0]
+    self_query = f"after_id={after_id}&limit={limit}" if after_id else f"limit={limit}"
+    links = [
+        PaginationLink(rel="self", href=f"{base_url}?{self_query}"),
+        PaginationLink(rel="first", href=f"{base_url}?limit={limit}"),
+    ]
+
+    if next_after_id is not None:
+        links.append(PaginationLink(rel="next", href=f"{base_url}?after_id={next_after_id}&limit={limit}"))
+
+    return links
@@ -1,5 +1,6 @@
 # app/security.py
 from builtins import Exception, ValueError, bool, int, str
+import asyncio
 import secrets
 import bcrypt
 from logging import getLogger
@@ -49,5 +50,33 @@ def verify_password(plain_password: str, hashed_password: str) -> bool:
         logger.error("Error verifying password: %s", e)
         raise ValueError("Authentication process encountered an unexpected error") from e
 
+async def hash_password_async(password: str, rounds: int = 12) -> str:
+    """
+    Hashes a password in the default thread pool so bcrypt's CPU cost does not block the event loop.
+
+    Args:
+        password (str): The plain text password to hash.
+        rounds (int): The cost factor that determines the computational cost of hashing.
+
+    Returns:
+        str: The hashed password.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, hash_password, password, rounds)
+
+async def verify_password_async(plain_password: str, hashed_password: str) -> bool:
+    """
+    Verifies a password in the default thread pool so bcrypt's CPU cost does not block the event loop.
+
+    Args:
+        plain_password (str): The plain text password to verify.
+        hashed_password (str): The bcrypt hashed password.
+
+    Returns:
+        bool: True if the password is correct, False otherwise.
+    """
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(None, verify_password, plain_password, hashed_password)
+
 def generate_verification_token():
     return secrets.token_urlsafe(16)  # Generates a secure 16-byte URL-safe token
\ No newline at end of file
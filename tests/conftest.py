@@ -35,6 +35,7 @@ from app.dependencies import get_db, get_settings
 from app.utils.security import hash_password
 from app.utils.template_manager import TemplateManager
 from app.services.email_service import EmailService
+from app.services.user_service import wait_for_pending_emails
 from app.services.jwt_service import create_access_token
 
 fake = Faker()
@@ -227,6 +228,13 @@ def user_token(user):
     token_data = {"sub": str(user.id), "role": user.role.name}
     return create_access_token(data=token_data, expires_delta=timedelta(minutes=30))
 
+@pytest.fixture
+async def mock_smtp():
+    """Stub out SMTP sends, and let background email tasks finish before the stub is removed."""
+    with patch("app.utils.smtp_connection.SMTPClient.send_email") as send_email:
+        yield send_email
+        await wait_for_pending_emails()
+
 @pytest.fixture
 def email_service():
     if settings.send_real_mail == 'true':
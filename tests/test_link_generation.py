@@ -6,7 +6,7 @@ from uuid import uuid4
 import pytest
 from fastapi import Request
 
-from app.utils.link_generation import create_link, create_pagination_link, create_user_links, generate_pagination_links
+from app.utils.link_generation import create_link, create_pagination_link, create_user_links, generate_keyset_pagination_links, generate_pagination_links
 
 from urllib.parse import urlparse, parse_qs, urlunparse, urlencode
 
@@ -49,3 +49,21 @@ def test_generate_pagination_links(mock_request):
     assert len(links) >= 4
     expected_self_url = "http://testserver/users?limit=5&skip=10"
     assert normalize_url(str(links[0].href)) == normalize_url(expected_self_url), "Self link should match expected URL"
+
+def test_generate_pagination_links_ignores_request_query(mock_request):
+    mock_request.url = "http://testserver/users?skip=10&limit=5"
+    links = generate_pagination_links(mock_request, 10, 5, 50)
+    assert normalize_url(str(links[0].href)) == normalize_url("http://testserver/users?limit=5&skip=10")
+
+def test_generate_keyset_pagination_links(mock_request):
+    after_id, next_after_id = uuid4(), uuid4()
+    mock_request.url = f"http://testserver/users?after_id={after_id}&limit=5"
+    links = {link.rel: normalize_url(str(link.href)) for link in generate_keyset_pagination_links(mock_request, after_id, 5, next_after_id)}
+    assert links["self"] == normalize_url(f"http://testserver/users?after_id={after_id}&limit=5")
+    assert links["first"] == normalize_url("http://testserver/users?limit=5")
+    assert links["next"] == normalize_url(f"http://testserver/users?after_id={next_after_id}&limit=5")
+    assert "prev" not in links
+
+def test_generate_keyset_pagination_links_last_page(mock_request):
+    links = generate_keyset_pagination_links(mock_request, uuid4(), 5, None)
+    assert [link.rel for link in links] == ["self", "first"]
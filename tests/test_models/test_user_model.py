@@ -1,8 +1,9 @@
 from builtins import repr
 from datetime import datetime, timezone
 import pytest
+from sqlalchemy import select
 from sqlalchemy.ext.asyncio import AsyncSession
-from app.models.user_model import User, UserRole
+from app.models.user_model import User, UserRole, UserRoleCount
 
 @pytest.mark.asyncio
 async def test_user_role(db_session: AsyncSession, user: User, admin_user: User, manager_user: User):
@@ -139,3 +140,24 @@ async def test_update_user_role(db_session: AsyncSession, user: User):
     await db_session.commit()
     await db_session.refresh(user)
     assert user.role == UserRole.ADMIN, "Role update should persist correctly in the database"
+
+
+@pytest.mark.asyncio
+async def test_user_role_counts_follow_users(db_session: AsyncSession, user: User, admin_user: User):
+    """
+    Tests that the users_role_counts trigger keeps user_role_counts in step with inserts,
+    role changes and deletes.
+    """
+    async def role_counts():
+        result = await db_session.execute(select(UserRoleCount.role, UserRoleCount.total))
+        return {role: total for role, total in result.all() if total}
+
+    assert await role_counts() == {"AUTHENTICATED": 1, "ADMIN": 1}
+
+    user.role = UserRole.MANAGER
+    await db_session.commit()
+    assert await role_counts() == {"MANAGER": 1, "ADMIN": 1}
+
+    await db_session.delete(admin_user)
+    await db_session.commit()
+    assert await role_counts() == {"MANAGER": 1}
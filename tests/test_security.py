@@ -1,7 +1,7 @@
 # test_security.py
 from builtins import RuntimeError, ValueError, isinstance, str
 import pytest
-from app.utils.security import hash_password, verify_password
+from app.utils.security import hash_password, hash_password_async, verify_password, verify_password_async
 
 def test_hash_password():
     """Test that hashing password returns a bcrypt hashed string."""
@@ -65,3 +65,12 @@ def test_hash_password_internal_error(monkeypatch):
     with pytest.raises(ValueError):
         hash_password("test")
 
+
+
+async def test_async_hash_and_verify_password():
+    """Test that the thread-pool variants hash and verify like the sync functions."""
+    password = "secure_password"
+    hashed = await hash_password_async(password)
+    assert hashed.startswith('$2b$')
+    assert await verify_password_async(password, hashed) is True
+    assert await verify_password_async("incorrect_password", hashed) is False
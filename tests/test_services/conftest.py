@@ -0,0 +1,50 @@
+"""
+Fixtures for the mock-only service tests.
+
+- `mock_db_factory`: Builds a `FakeSession` that records what the service did with it.
+"""
+
+import pytest
+
+
+class FakeSession:
+    """
+    Stand-in for AsyncSession with only the methods the service tests touch.
+
+    Calls are recorded in plain lists and counters instead of mocks; tests set `execute_result`
+    and `scalar_results` (returned in order, then None) to control what queries return.
+    """
+
+    def __init__(self):
+        self.added = []
+        self.executed = []  # (statement, params) per execute() call
+        self.fetched = []  # (entity, ident) per get() call
+        self.commits = 0
+        self.rollbacks = 0
+        self.execute_result = None
+        self.scalar_results = []
+
+    def add(self, instance):
+        self.added.append(instance)
+
+    async def get(self, entity, ident, **kwargs):
+        self.fetched.append((entity, ident))
+        return None
+
+    async def scalar(self, statement, params=None, **kwargs):
+        return self.scalar_results.pop(0) if self.scalar_results else None
+
+    async def execute(self, statement, params=None, **kwargs):
+        self.executed.append((statement, params))
+        return self.execute_result
+
+    async def commit(self):
+        self.commits += 1
+
+    async def rollback(self):
+        self.rollbacks += 1
+
+
+@pytest.fixture
+def mock_db_factory():
+    return FakeSession
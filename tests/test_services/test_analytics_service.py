@@ -1,149 +1,228 @@
-import sys
-print(sys.path)
 import pytest
 from datetime import datetime, timezone
-from unittest.mock import AsyncMock, MagicMock
+from types import SimpleNamespace
+from unittest.mock import AsyncMock, patch
 from uuid import uuid4
 
-from app.models.user_model import User, UserRole
 from app.models.user_model import RetentionAnalytics
+from app.routers.user_routes import get_retention_metrics
 from app.services.analytics_service import AnalyticsService
 from app.services.user_service import UserService
 
+# Fixed "current" time for sample data and for the service clock
+FROZEN_NOW = datetime(2024, 12, 18, 1, 0, 27, tzinfo=timezone.utc)
+
+
+class _FrozenDatetime(datetime):
+    @classmethod
+    def now(cls, tz=None):
+        return FROZEN_NOW
+
+
+# Aggregate rows for the retention metrics query: (total anonymous, total authenticated, inactive_24hr)
+COUNTS_FULL = (5, 10, 3)
+COUNTS_INACTIVE_ONLY = (0, 0, 3)
+COUNTS_EMPTY = (0, 0, 0)  # No users in the database
+COUNTS_NO_LAST_LOGIN = (10, 20, 0)  # Users without last login timestamps are not counted as inactive
+COUNTS_LARGE = (1_000_000, 2_000_000, 500_000)
+
+# One stored snapshot and the JSON the service serialises it to, shared by the retention tests
+_MOCK_RETENTION = [
+    RetentionAnalytics(
+        timestamp=FROZEN_NOW,
+        total_anonymous_users=10,
+        total_authenticated_users=20,
+        conversion_rate=66.67,
+        inactive_users_24hr=5,
+    )
+]
+_SERIALIZED = [
+    {
+        "timestamp": snapshot.timestamp.isoformat(),
+        "total_anonymous_users": snapshot.total_anonymous_users,
+        "total_authenticated_users": snapshot.total_authenticated_users,
+        "conversion_rate": snapshot.conversion_rate,
+        "inactive_users_24hr": snapshot.inactive_users_24hr,
+    }
+    for snapshot in _MOCK_RETENTION
+]
+
+
+@pytest.fixture(autouse=True)
+def frozen_clock(monkeypatch):
+    """Make the analytics service read FROZEN_NOW instead of the wall clock."""
+    monkeypatch.setattr("app.services.analytics_service.datetime", _FrozenDatetime)
+
+
+@pytest.fixture
+def patched_service():
+    """Make AnalyticsService.get_retention_data return _SERIALIZED, restoring it afterwards; yields the mock."""
+    with patch.object(AnalyticsService, "get_retention_data", new=AsyncMock(return_value=_SERIALIZED)) as mock_get:
+        yield mock_get
+
+
+class _Result:
+    """Plain stand-in for the Result returned by `await db.execute(...)`."""
+
+    def __init__(self, data):
+        self._data = data
+
+    def scalars(self):
+        return self
+
+    def all(self):
+        return self._data
+
+    def one(self):
+        return self._data
+
+    def scalar_one_or_none(self):
+        return self._data
+
+
+def mock_aggregate_counts(mock_db, counts):
+    """Stub the snapshot lock as free, this period as unsaved, and the aggregate row of the metrics query."""
+    mock_db.scalar_results = [True, False]
+    mock_db.execute_result = _Result(counts)
+
+
+def inserted_snapshot(mock_db):
+    """Return the column values of the RetentionAnalytics row passed to the final INSERT."""
+    insert_stmt, _ = mock_db.executed[-1]
+    return SimpleNamespace(**insert_stmt.compile().params)
+
 @pytest.mark.asyncio
-async def test_log_user_activity():
-    """Test updating the last login timestamp for a user."""
-    mock_db = AsyncMock()
+async def test_log_user_activity(mock_db_factory):
+    """Test that last login timestamps are buffered and flushed in one batched update."""
+    mock_db = mock_db_factory()
     user_id = uuid4()
-    mock_user = User(id=user_id, last_login_at=None)
-    mock_db.get.return_value = mock_user
 
     await AnalyticsService.log_user_activity(user_id, mock_db)
+    assert mock_db.commits == 0
 
-    assert mock_user.last_login_at is not None
-    assert isinstance(mock_user.last_login_at, datetime)
-    mock_db.commit.assert_called_once()
-
-@pytest.mark.asyncio
-async def test_calculate_total_users():
-    """Test calculation of total anonymous and authenticated users."""
-    mock_db = AsyncMock()
-    mock_db.scalar.side_effect = [5, 10, 0]  # Total anonymous, total authenticated, inactive_24hr
+    flushed = await AnalyticsService.flush_user_activity(mock_db)
 
-    await AnalyticsService.calculate_retention_metrics(mock_db)
+    assert flushed == 1
+    _, rows = mock_db.executed[-1]
+    assert rows[0]["user_id"] == user_id
+    assert rows[0]["ts"] == FROZEN_NOW
+    assert mock_db.commits == 1
 
-    analytics_instance = mock_db.add.call_args[0][0]
-    assert analytics_instance.total_anonymous_users == 5
-    assert analytics_instance.total_authenticated_users == 10
-    assert analytics_instance.inactive_users_24hr == 0
-    mock_db.commit.assert_called_once()
+    # Nothing left to write after a flush
+    assert await AnalyticsService.flush_user_activity(mock_db) == 0
 
 @pytest.mark.asyncio
-async def test_calculate_conversion_rate():
-    """Test calculation of user conversion rate."""
-    mock_db = AsyncMock()
-    mock_db.scalar.side_effect = [5, 10, 0]  # Total anonymous, authenticated, inactive_24hr
+async def test_flush_keeps_activity_on_failure(mock_db_factory):
+    """Test that buffered timestamps survive a flush whose commit fails."""
+    failing_db = mock_db_factory()
 
-    await AnalyticsService.calculate_retention_metrics(mock_db)
+    async def fail_commit():
+        raise RuntimeError("connection lost")
+
+    failing_db.commit = fail_commit
+    user_id = uuid4()
 
-    analytics_instance = mock_db.add.call_args[0][0]
-    assert analytics_instance.conversion_rate == "66.67%"
-    assert analytics_instance.inactive_users_24hr == 0
+    await AnalyticsService.log_user_activity(user_id, failing_db)
+    with pytest.raises(RuntimeError):
+        await AnalyticsService.flush_user_activity(failing_db)
+
+    mock_db = mock_db_factory()
+    assert await AnalyticsService.flush_user_activity(mock_db) == 1
+    _, rows = mock_db.executed[-1]
+    assert rows[0]["user_id"] == user_id
 
 @pytest.mark.asyncio
-async def test_identify_inactive_users():
-    """Test identifying inactive users in the last 24 hours."""
-    mock_db = AsyncMock()
-    mock_db.scalar.side_effect = [0, 0, 3]  # Total anonymous, authenticated, inactive_24hr
+@pytest.mark.parametrize("counts, expected", [
+    pytest.param(
+        COUNTS_FULL,
+        {"total_anonymous_users": 5, "total_authenticated_users": 10,
+         "conversion_rate": 66.67, "inactive_users_24hr": 3},
+        id="totals-and-conversion-rate",
+    ),
+    pytest.param(
+        COUNTS_INACTIVE_ONLY,
+        {"inactive_users_24hr": 3},
+        id="inactive-users",
+    ),
+    pytest.param(
+        COUNTS_EMPTY,
+        {"total_anonymous_users": 0, "total_authenticated_users": 0,
+         "conversion_rate": 0, "inactive_users_24hr": 0},
+        id="empty",
+    ),
+    pytest.param(
+        COUNTS_NO_LAST_LOGIN,
+        {"total_anonymous_users": 10, "total_authenticated_users": 20,
+         "conversion_rate": 66.67, "inactive_users_24hr": 0},
+        id="missing-last-login",
+    ),
+    pytest.param(
+        COUNTS_LARGE,
+        {"total_anonymous_users": 1_000_000, "total_authenticated_users": 2_000_000,
+         "conversion_rate": 66.67, "inactive_users_24hr": 500_000},
+        id="large-counts",
+    ),
+])
+async def test_calculate_retention_metrics(mock_db_factory, counts, expected):
+    """Test that the retention snapshot is computed from the aggregate counts and saved."""
+    mock_db = mock_db_factory()
+    mock_aggregate_counts(mock_db, counts)
 
     await AnalyticsService.calculate_retention_metrics(mock_db)
 
-    analytics_instance = mock_db.add.call_args[0][0]
-    assert analytics_instance.inactive_users_24hr == 3
+    analytics_instance = inserted_snapshot(mock_db)
+    for field, value in expected.items():
+        assert getattr(analytics_instance, field) == value
+    assert mock_db.commits == 1
 
 @pytest.mark.asyncio
-async def test_save_retention_analytics():
-    """Test saving retention metrics to the database."""
-    mock_db = AsyncMock()
-    mock_db.scalar.side_effect = [5, 10, 3, 0]  # Enough values for all metrics
+@pytest.mark.parametrize("lock_taken, period_saved", [
+    pytest.param(False, None, id="another-worker-holds-lock"),
+    pytest.param(True, True, id="period-already-saved"),
+])
+async def test_skip_duplicate_snapshot(mock_db_factory, lock_taken, period_saved):
+    """Test that only one worker saves the retention snapshot for a given period."""
+    mock_db = mock_db_factory()
+    mock_db.scalar_results = [lock_taken, period_saved]
 
     await AnalyticsService.calculate_retention_metrics(mock_db)
 
-    analytics_instance = mock_db.add.call_args[0][0]
-    assert analytics_instance.total_anonymous_users == 5
-    assert analytics_instance.total_authenticated_users == 10
-    assert analytics_instance.conversion_rate == "66.67%"
-    assert analytics_instance.inactive_users_24hr == 3
-
-    # Ensure that commit() was called
-    mock_db.commit.assert_called_once()
+    assert mock_db.executed == []
+    assert mock_db.commits == 0
 
 @pytest.mark.asyncio
-async def test_get_retention_data():
+async def test_get_retention_data(mock_db_factory):
     """Test retrieval of retention analytics data."""
-    mock_db = AsyncMock()
-    mock_retention_data = [
-        RetentionAnalytics(
-            timestamp=datetime(2024, 12, 18, 1, 0, 27, tzinfo=timezone.utc),
-            total_anonymous_users=10,
-            total_authenticated_users=20,
-            conversion_rate="66.67%",
-            inactive_users_24hr=5,
-        )
-    ]
+    mock_db = mock_db_factory()
 
     # Mock the `db.execute` result to return retention records
-    mock_db.execute.return_value.scalars.return_value.all.return_value = mock_retention_data
+    mock_db.execute_result = _Result(_MOCK_RETENTION)
 
     # Call the service method
     data = await AnalyticsService.get_retention_data(mock_db)
 
     # Assertions
-    assert data == [
-        {
-            "timestamp": mock_retention_data[0].timestamp.isoformat(),
-            "total_anonymous_users": mock_retention_data[0].total_anonymous_users,
-            "total_authenticated_users": mock_retention_data[0].total_authenticated_users,
-            "conversion_rate": mock_retention_data[0].conversion_rate,
-            "inactive_users_24hr": mock_retention_data[0].inactive_users_24hr,
-        }
-    ]
+    assert data == _SERIALIZED
+    assert len(mock_db.executed) == 1
 
 
 
 @pytest.mark.asyncio
-async def test_get_retention_data():
-    """Test retrieval of retention analytics data."""
-    # Hardcoded mock data to simulate database return
-    mock_retention_data = [
-        {
-            "timestamp": "2024-12-18T01:00:27+00:00",
-            "total_anonymous_users": 10,
-            "total_authenticated_users": 20,
-            "conversion_rate": "66.67%",
-            "inactive_users_24hr": 5,
-        }
-    ]
-
-    # Patch the `get_retention_data` method to return hardcoded data
-    async def mock_get_retention_data(db):
-        return mock_retention_data
-
-    # Replace the real method with the mock method
-    AnalyticsService.get_retention_data = mock_get_retention_data
+async def test_retention_route_passes_limit(mock_db_factory, patched_service):
+    """Test that the retention route forwards its session and limit and wraps the snapshots."""
+    mock_db = mock_db_factory()
 
-    # Call the service method
-    data = await AnalyticsService.get_retention_data(None)
+    response = await get_retention_metrics(limit=5, db=mock_db)
 
-    # Assertions
-    assert data == mock_retention_data
+    assert response == {"data": _SERIALIZED}
+    patched_service.assert_awaited_once_with(mock_db, 5)
 
 
 
 @pytest.mark.asyncio
-async def test_invitation_validation_and_email_sending():
+async def test_invitation_validation_and_email_sending(mock_db_factory, mock_smtp):
     """Test user invitation logic and email sending."""
-    mock_db = AsyncMock()
+    mock_db = mock_db_factory()
     mock_email_service = AsyncMock()
     inviter_id = uuid4()
     email = "invitee@example.com"
@@ -158,114 +237,28 @@ async def test_invitation_validation_and_email_sending():
 
     # Verify email was sent
     mock_email_service.send_user_email.assert_called_once()
-    mock_db.add.assert_called_once()  # Ensure the user was added to the database
-    mock_db.commit.assert_called_once()  # Ensure the commit was performed
+    assert len(mock_db.added) == 1  # Ensure the user was added to the database
+    assert mock_db.commits == 1  # Ensure the commit was performed
 
 @pytest.mark.asyncio
-async def test_registration_through_invitation():
+async def test_registration_through_invitation(mock_db_factory):
     """Test user registration through invitation with a valid token."""
-    mock_db = AsyncMock()
-    mock_user = User(id=uuid4(), verification_token="valid-token", email_verified=False)
-    mock_db.get.return_value = mock_user
+    mock_db = mock_db_factory()
+    user_id = uuid4()
+    mock_db.execute_result = _Result(user_id)
 
-    success = await UserService.verify_email_with_token(mock_db, mock_user.id, "valid-token")
+    success = await UserService.verify_email_with_token(mock_db, user_id, "valid-token")
 
     assert success is True
-    assert mock_user.email_verified is True
-    mock_db.commit.assert_called_once()
-
-@pytest.mark.asyncio
-async def test_edge_cases_empty_data():
-    """Test edge case where no users are present in the database."""
-    mock_db = AsyncMock()
-    mock_db.scalar.side_effect = [0, 0, 0]  # All metrics return 0
-
-    await AnalyticsService.calculate_retention_metrics(mock_db)
-
-    analytics_instance = mock_db.add.call_args[0][0]
-    assert analytics_instance.total_anonymous_users == 0
-    assert analytics_instance.total_authenticated_users == 0
-    assert analytics_instance.conversion_rate == "0%"
-    assert analytics_instance.inactive_users_24hr == 0
-    mock_db.commit.assert_called_once()
-
-
-@pytest.mark.asyncio
-async def test_handle_missing_last_login_timestamps():
-    """Test retention analytics when some users have no last login timestamps."""
-    mock_db = AsyncMock()
-
-    # Mock users with missing last_login_at timestamps
-    mock_db.scalar.side_effect = [
-        10,  # Total anonymous users
-        20,  # Total authenticated users
-        0,   # Inactive users in the last 24 hours
-    ]
-
-    await AnalyticsService.calculate_retention_metrics(mock_db)
-
-    # Verify retention analytics instance created
-    analytics_instance = mock_db.add.call_args[0][0]
-    assert analytics_instance.total_anonymous_users == 10
-    assert analytics_instance.total_authenticated_users == 20
-    assert analytics_instance.conversion_rate == "66.67%"
-    assert analytics_instance.inactive_users_24hr == 0
-
-    mock_db.commit.assert_called_once()
-
+    assert mock_db.fetched == []
+    assert mock_db.commits == 1
 
 @pytest.mark.asyncio
-async def test_large_user_counts():
-    """Test retention analytics with large numbers of users to ensure scalability."""
-    mock_db = AsyncMock()
-
-    # Simulate large numbers of users
-    mock_db.scalar.side_effect = [
-        1_000_000,  # Total anonymous users
-        2_000_000,  # Total authenticated users
-        500_000,    # Inactive users in the last 24 hours
-    ]
-
-    await AnalyticsService.calculate_retention_metrics(mock_db)
-
-    # Verify retention analytics instance created
-    analytics_instance = mock_db.add.call_args[0][0]
-    assert analytics_instance.total_anonymous_users == 1_000_000
-    assert analytics_instance.total_authenticated_users == 2_000_000
-    assert analytics_instance.conversion_rate == "66.67%"
-    assert analytics_instance.inactive_users_24hr == 500_000
-
-    mock_db.commit.assert_called_once()
-
-@pytest.mark.asyncio
-async def test_api_get_retention_metrics(async_client, mocker):
+async def test_api_get_retention_metrics(async_client, patched_service):
     """Test the /analytics/retention API endpoint."""
-    mock_retention_data = [
-        {
-            "timestamp": datetime(2024, 12, 18, 1, 0, 27, tzinfo=timezone.utc).isoformat(),
-            "total_anonymous_users": 10,
-            "total_authenticated_users": 20,
-            "conversion_rate": "66.67%",
-            "inactive_users_24hr": 5,
-        }
-    ]
-
-    # Patch the `get_retention_data` method to return mock data
-    mocker.patch(
-        "app.services.analytics_service.AnalyticsService.get_retention_data",
-        return_value=mock_retention_data,
-    )
-
     # Call the API endpoint
     response = await async_client.get("/analytics/retention")
 
     # Assertions
     assert response.status_code == 200
-    assert response.json() == {"data": mock_retention_data}
-
-
-
-
-
-
-
+    assert response.json() == {"data": _SERIALIZED}
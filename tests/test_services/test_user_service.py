@@ -9,7 +9,7 @@ from app.utils.nickname_gen import generate_nickname
 pytestmark = pytest.mark.asyncio
 
 # Test creating a user with valid data
-async def test_create_user_with_valid_data(db_session, email_service):
+async def test_create_user_with_valid_data(db_session, email_service, mock_smtp):
     user_data = {
         "nickname": generate_nickname(),
         "email": "valid_user@example.com",
@@ -20,6 +20,30 @@ async def test_create_user_with_valid_data(db_session, email_service):
     assert user is not None
     assert user.email == user_data["email"]
 
+# Test that a generated nickname that is already taken is retried with a new one
+async def test_create_user_retries_taken_nickname(db_session, email_service, user, monkeypatch, mock_smtp):
+    nicknames = iter([user.nickname, "fresh_nickname_123"])
+    monkeypatch.setattr("app.services.user_service.generate_nickname", lambda: next(nicknames))
+    user_data = {
+        "email": "retry_nickname@example.com",
+        "password": "ValidPassword123!",
+        "role": UserRole.AUTHENTICATED.name,
+    }
+    new_user = await UserService.create(db_session, user_data, email_service)
+    assert new_user is not None
+    assert new_user.nickname == "fresh_nickname_123"
+
+# Test that an integrity error other than a nickname collision is not retried
+async def test_insert_duplicate_email_is_not_retried(db_session, user, monkeypatch):
+    attempts = []
+    def counting_nickname():
+        attempts.append(1)
+        return f"unique_nickname_{len(attempts)}"
+    monkeypatch.setattr("app.services.user_service.generate_nickname", counting_nickname)
+    duplicate = User(email=user.email, hashed_password=user.hashed_password, role=UserRole.ANONYMOUS)
+    assert await UserService._insert_with_unique_nickname(db_session, duplicate) is False
+    assert len(attempts) == 1
+
 # Test creating a user with invalid data
 async def test_create_user_with_invalid_data(db_session, email_service):
     user_data = {
@@ -61,6 +85,22 @@ async def test_get_by_email_user_does_not_exist(db_session):
     retrieved_user = await UserService.get_by_email(db_session, "non_existent_email@example.com")
     assert retrieved_user is None
 
+# Test that a user loaded by email is not returned again once deleted
+async def test_get_by_email_after_delete(db_session, user):
+    assert await UserService.get_by_email(db_session, user.email) is not None
+    await UserService.delete(db_session, user.id)
+    assert await UserService.get_by_email(db_session, user.email) is None
+
+# Test that a rollback, which expires loaded users, does not break the email lookup
+async def test_get_by_email_after_rollback(db_session, user):
+    email = user.email
+    assert await UserService.get_by_email(db_session, email) is not None
+    await db_session.rollback()
+    fetched_user = await UserService.get_by_email(db_session, email)
+    assert fetched_user is not None
+    assert fetched_user.email == email
+    assert await UserService.is_account_locked(db_session, email) is False
+
 # Test updating a user with valid data
 @pytest.mark.asyncio
 async def test_update_user_valid_data(db_session, user):
@@ -90,8 +130,16 @@ async def test_list_users_with_pagination(db_session, users_with_same_role_50_us
     assert len(users_page_2) == 10
     assert users_page_1[0].id != users_page_2[0].id
 
+# Test listing users with keyset pagination
+async def test_list_users_with_keyset_pagination(db_session, users_with_same_role_50_users):
+    users_page_1 = await UserService.list_users(db_session, limit=10)
+    users_page_2 = await UserService.list_users(db_session, limit=10, after_id=users_page_1[-1].id)
+    assert len(users_page_2) == 10
+    assert users_page_2[0].id > users_page_1[-1].id
+    assert [u.id for u in users_page_2] == [u.id for u in await UserService.list_users(db_session, skip=10, limit=10)]
+
 # Test registering a user with valid data
-async def test_register_user_with_valid_data(db_session, email_service):
+async def test_register_user_with_valid_data(db_session, email_service, mock_smtp):
     user_data = {
         "nickname": generate_nickname(),
         "email": "register_valid_user@example.com",